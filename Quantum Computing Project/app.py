@@ -1,110 +1,295 @@
 import streamlit as st
 import numpy as np
+import pandas as pd
 import time
+from numba import njit
+
+# Photon polarizations indexed by the 2-bit code (bit << 1) | basis:
+# 0 bit/+ basis, 0 bit/X basis, 1 bit/+ basis, 1 bit/X basis
+_POLARIZATIONS = np.array(['↑', '↗', '→', '↘'], dtype='<U1')
+
+# Basis symbols indexed by basis: 0 -> rectilinear, 1 -> diagonal
+_BASIS_SYMBOLS = np.array(['+', 'X'], dtype='<U1')
+
+# Probability that Eve intercepts and resends a qubit
+_EVE_INTERCEPT_PROB = 0.2
+
+# Error rate above which the channel is considered compromised
+_DETECTION_THRESHOLD = 0.15
+
+@njit(cache=True)
+def _bb84_core(alice_bits, alice_bases, bob_bases, eve_rand, eve_bits, mismatch_bits, subset_idx):
+    """
+    Fused BB84 measurement, key sifting and error estimation over pre-drawn
+    (n_runs, n_qubits) random arrays; each row is one independent run
+    """
+    n_runs, n_qubits = alice_bits.shape
+    bob_results = np.empty((n_runs, n_qubits), dtype=np.uint8)
+    matched = np.empty((n_runs, n_qubits), dtype=np.bool_)
+    shared_keys = np.empty((n_runs, n_qubits), dtype=np.uint8)
+    key_lengths = np.zeros(n_runs, dtype=np.int64)
+    error_rates = np.empty(n_runs, dtype=np.float64)
+
+    for r in range(n_runs):
+        key_length = 0
+        for i in range(n_qubits):
+            if alice_bases[r, i] == bob_bases[r, i]:
+                # Use original bit if no eavesdropping, else use eavesdropped bit
+                bit = eve_bits[r, i] if eve_rand[r, i] < _EVE_INTERCEPT_PROB else alice_bits[r, i]
+                matched[r, i] = True
+                shared_keys[r, key_length] = bit
+                key_length += 1
+            else:
+                bit = mismatch_bits[r, i]
+                matched[r, i] = False
+            bob_results[r, i] = bit
+        key_lengths[r] = key_length
+
+        errors = 0
+        for i in subset_idx[r]:
+            if alice_bits[r, i] != bob_results[r, i]:
+                errors += 1
+        error_rates[r] = errors / max(subset_idx.shape[1], 1)
+
+    return bob_results, matched, shared_keys, key_lengths, error_rates
 
 class FastQuantumKeyDistribution:
     @staticmethod
     @st.cache_data
-    def bb84_protocol(n_qubits=10, _seed=None):
+    def bb84_protocol(n_qubits=10, seed=None):
         """
         Optimized BB84 Protocol Simulation with Detailed Outputs
         """
-        if _seed is not None:
-            np.random.seed(_seed)
+        rng = np.random.default_rng(seed)
 
         # Generate initial quantum state
-        alice_bits = np.random.randint(2, size=n_qubits)
-        alice_bases = np.random.randint(2, size=n_qubits)
-        bob_bases = np.random.randint(2, size=n_qubits)
+        alice_bits = rng.integers(0, 2, size=n_qubits, dtype=np.uint8)
+        alice_bases = rng.integers(0, 2, size=n_qubits, dtype=np.uint8)
+        bob_bases = rng.integers(0, 2, size=n_qubits, dtype=np.uint8)
 
         # Photon polarizations based on bits and bases
-        polarization_symbols = {
-            (0, 0): '↑',  # 0 bit, + basis
-            (0, 1): '↗',  # 0 bit, X basis
-            (1, 0): '→',  # 1 bit, + basis
-            (1, 1): '↘'   # 1 bit, X basis
-        }
+        alice_polarizations = _POLARIZATIONS[(alice_bits << 1) | alice_bases]
 
-        # Derive polarizations
-        alice_polarizations = [polarization_symbols[(bit, basis)] for bit, basis in zip(alice_bits, alice_bases)]
-
-        # Simplified eavesdropping model
-        def fast_eavesdropping_simulation(alice_bit, alice_basis):
-            eve_intercept_prob = 0.2
-            if np.random.random() < eve_intercept_prob:
-                return np.random.randint(2)
-            return None
-
-        bob_results = []
-        bob_polarizations = []
-        eve_interventions = []
-        matched_bases = []
-        shared_key = []
-
-        for bit, alice_basis, bob_basis, polarization in zip(alice_bits, alice_bases, bob_bases,alice_polarizations):
-            eve_intervention = fast_eavesdropping_simulation(bit, alice_basis)
-            eve_interventions.append(eve_intervention is not None)
-
-            # Track matched bases
-            if alice_basis == bob_basis:
-                matched_bases.append(True)
-                # Use original bit if no eavesdropping, else use eavesdropped bit
-                bob_result = bit if eve_intervention is None else eve_intervention
-                bob_results.append(bob_result)
-                
-                # Only add to shared key if bases match
-                shared_key.append(bob_result)
-                bob_polarizations.append(polarization)  # Bob measures the same polarization
+        # Simplified eavesdropping model: Eve intercepts some of the qubits
+        # and resends a random bit
+        eve_rand = rng.random(n_qubits)
+        eve_bits = rng.integers(0, 2, size=n_qubits, dtype=np.uint8)
 
-            else:
-                matched_bases.append(False)
-                bob_results.append(np.random.randint(2))
-                bob_polarizations.append('?' if bob_basis == 0 else '?')  # Bob can't measure correctly with mismatched basis
+        # Bob's measurement is random with mismatched bases
+        mismatch_bits = rng.integers(0, 2, size=n_qubits, dtype=np.uint8)
+
+        # Subset of qubits publicly compared to estimate the error rate
+        comparison_subset = rng.permutation(n_qubits)[:n_qubits // 2]
 
-        # Faster error rate calculation
-        comparison_subset = np.random.choice(n_qubits, n_qubits // 2, replace=False)
-        error_rate = np.mean(alice_bits[comparison_subset] != np.array(bob_results)[comparison_subset])
+        # Run the kernel as a single-row batch
+        bob_results, matched_bases, shared_keys, key_lengths, error_rates = _bb84_core(
+            alice_bits[None, :], alice_bases[None, :], bob_bases[None, :],
+            eve_rand[None, :], eve_bits[None, :], mismatch_bits[None, :],
+            comparison_subset[None, :]
+        )
+        bob_results = bob_results[0]
+        matched_bases = matched_bases[0]
+        shared_key = shared_keys[0, :key_lengths[0]]
+        error_rate = float(error_rates[0])
+
+        # Bob can't measure correctly with mismatched basis
+        bob_polarizations = np.where(matched_bases, alice_polarizations, '?')
 
         return {
-            'alice_bits': alice_bits.tolist(),
+            'alice_bits': alice_bits,
             'bob_bits': bob_results,
-            'alice_bases': ['+' if b == 0 else 'X' for b in alice_bases],
-            'bob_bases':['+' if b == 0 else 'X' for b in bob_bases],
+            'alice_bases': _BASIS_SYMBOLS[alice_bases],
+            'bob_bases': _BASIS_SYMBOLS[bob_bases],
             'alice_polarizations': alice_polarizations,
             'bob_polarizations': bob_polarizations,
             'matched_bases': matched_bases,
-            'shared_key': shared_key,
+            # Shared key stored bit-packed; unpack with np.unpackbits(..., count=length)
+            'shared_key_packed': np.packbits(shared_key),
+            'shared_key_length': len(shared_key),
             'error_rate': error_rate,
-            'eavesdropping_detected': error_rate > 0.15
+            'eavesdropping_detected': error_rate > _DETECTION_THRESHOLD
         }
 
     @staticmethod
     @st.cache_data
-    def e91_protocol(n_qubits=10, _seed=None):
+    def bb84_batch(n_qubits=10, n_runs=100, seed=None):
+        """
+        Repeated BB84 runs sampled as (n_runs, n_qubits) arrays for error statistics
+        """
+        rng = np.random.default_rng(seed)
+        shape = (n_runs, n_qubits)
+
+        alice_bits = rng.integers(0, 2, size=shape, dtype=np.uint8)
+        alice_bases = rng.integers(0, 2, size=shape, dtype=np.uint8)
+        bob_bases = rng.integers(0, 2, size=shape, dtype=np.uint8)
+        eve_rand = rng.random(shape)
+        eve_bits = rng.integers(0, 2, size=shape, dtype=np.uint8)
+        mismatch_bits = rng.integers(0, 2, size=shape, dtype=np.uint8)
+
+        # Independent comparison subset for every run
+        comparison_subset = np.ascontiguousarray(rng.permuted(
+            np.tile(np.arange(n_qubits), (n_runs, 1)), axis=1
+        )[:, :n_qubits // 2])
+
+        _, _, _, key_lengths, error_rates = _bb84_core(
+            alice_bits, alice_bases, bob_bases,
+            eve_rand, eve_bits, mismatch_bits, comparison_subset
+        )
+
+        return {
+            'key_lengths': key_lengths,
+            'error_rates': error_rates,
+            'eavesdropping_detected': error_rates > _DETECTION_THRESHOLD
+        }
+
+    @staticmethod
+    @st.cache_data
+    def e91_protocol(n_qubits=10, seed=None):
         """
         Simplified E91 Protocol Simulation with Eavesdropping
         """
-        if _seed is not None:
-            np.random.seed(_seed)
+        rng = np.random.default_rng(seed)
 
         # Probabilistic entanglement and correlation simulation
-        alice_bases = np.random.randint(2, size=n_qubits)
-        bob_bases = np.random.randint(2, size=n_qubits)
+        alice_bases = rng.integers(0, 2, size=n_qubits, dtype=np.uint8)
+        bob_bases = rng.integers(0, 2, size=n_qubits, dtype=np.uint8)
 
         # Simulate correlated bits and potential eavesdropping
-        correlated_bits = (alice_bases == bob_bases).astype(int)
-        correlation_rate = np.mean(correlated_bits)
+        correlated_count = np.count_nonzero(alice_bases == bob_bases)
+        correlation_rate = correlated_count / n_qubits
 
         # Simplified eavesdropping detection
         eavesdropping_detected = correlation_rate < 0.7
 
         return {
-            'alice_bases': alice_bases.tolist(),
-            'bob_bases': bob_bases.tolist(),
+            'alice_bases': alice_bases,
+            'bob_bases': bob_bases,
             'correlation_rate': correlation_rate,
             'eavesdropped': eavesdropping_detected
         }
 
+@st.cache_data
+def _bb84_dataframes(n_qubits, seed):
+    """
+    Build the BB84 display tables once per (n_qubits, seed)
+    """
+    result = FastQuantumKeyDistribution.bb84_protocol(n_qubits, seed=seed)
+
+    alice_data = pd.DataFrame({
+        'Bits': result['alice_bits'],
+        'Bases': result['alice_bases'],
+        'Polarizations Sent': result['alice_polarizations']
+    })
+    bob_data = pd.DataFrame({
+        'Bits': result['bob_bits'],
+        'Bases': result['bob_bases'],
+        'Polarizations Measured': result['bob_polarizations']
+    })
+    matched_data = pd.DataFrame({
+        'Index': np.arange(n_qubits),
+        'Alice Basis': result['alice_bases'],
+        'Bob Basis': result['bob_bases'],
+        'Bases Matched': result['matched_bases']
+    })
+    return alice_data, bob_data, matched_data
+
+@st.fragment
+def run_simulation(protocol, n_qubits, random_seed):
+    """
+    Run the selected protocol and render its metrics and data tabs;
+    widgets in here only rerun this fragment
+    """
+    st.caption(f"Results for {protocol} with {n_qubits} qubits, seed {random_seed}")
+    with st.spinner('Performing Quantum Simulation...'):
+        if protocol == "BB84 Protocol":
+            result = FastQuantumKeyDistribution.bb84_protocol(n_qubits, seed=random_seed)
+            alice_data, bob_data, matched_data = _bb84_dataframes(n_qubits, random_seed)
+            
+            # Results columns
+            col1, col2, col3, col4 = st.columns(4)
+            
+            with col1:
+                st.metric("Total Qubits", n_qubits)
+            with col2:
+                st.metric("Matched Bases", f"{int(result['matched_bases'].sum())} / {n_qubits}")
+            with col3:
+                st.metric("Shared Key Length", result['shared_key_length'])
+            with col4:
+                st.metric(
+                    "Quantum Channel",
+                    "Compromised" if result['eavesdropping_detected'] else "Secure"
+                )
+        else:
+            result = FastQuantumKeyDistribution.e91_protocol(n_qubits, seed=random_seed)
+            
+            col1, col2, col3 = st.columns(3)
+            
+            with col1:
+                st.metric("Total Qubits", n_qubits)
+            with col2:
+                st.metric("Correlation Rate", f"{result['correlation_rate']:.2%}")
+            with col3:
+                st.metric(
+                    "Quantum Channel",
+                    "Compromised" if result['eavesdropped'] else "Secure"
+                )
+
+        # Detailed data display
+        st.header("Detailed Quantum Key Distribution Data")
+        
+        # Create tabs for different data views
+        tab1, tab2, tab3 = st.tabs(["Bits & Bases", "Matched Bases", "Shared Key"])
+        
+        with tab1:
+            if protocol == "BB84 Protocol":
+                st.subheader("Alice's Bits and Bases")
+                st.dataframe(alice_data)
+                
+                st.subheader("Bob's Bits and Bases")
+                st.dataframe(bob_data)
+            else:
+                st.write("Detailed data is not available for the E91 protocol.")
+        
+        with tab2:
+            if protocol == "BB84 Protocol":
+                st.subheader("Matched Bases Comparison")
+                st.dataframe(matched_data, use_container_width=True)
+            else:
+                st.write("Detailed data is not available for the E91 protocol.")
+        
+        with tab3:
+            if protocol == "BB84 Protocol":
+                st.subheader("Shared Quantum Key")
+                st.write("Bits where Alice and Bob used the same basis:")
+                shared_key = np.unpackbits(
+                    result['shared_key_packed'], count=result['shared_key_length']
+                )
+                st.dataframe(shared_key)
+            else:
+                st.write("Detailed data is not available for the E91 protocol.")
+
+        if protocol == "BB84 Protocol":
+            st.header("Error Rate Distribution")
+            n_runs = st.number_input(
+                "Number of Runs",
+                min_value=1,
+                max_value=1000,
+                value=1,
+                key="n_runs",
+                help="Repeat the BB84 simulation to show the error rate distribution"
+            )
+
+            if n_runs > 1:
+                batch = FastQuantumKeyDistribution.bb84_batch(n_qubits, n_runs, seed=random_seed)
+
+                st.write(
+                    f"Eavesdropping detected in {int(batch['eavesdropping_detected'].sum())} "
+                    f"of {n_runs} runs; mean shared key length "
+                    f"{batch['key_lengths'].mean():.1f} / {n_qubits}"
+                )
+                error_rate_counts = pd.Series(batch['error_rates']).round(2).value_counts().sort_index()
+                st.bar_chart(error_rate_counts)
+
 def main():
     # Configure page with improved performance settings
     st.set_page_config(
@@ -145,93 +330,17 @@ def main():
 
     # Performance monitoring and simulation
     if st.sidebar.button("🚀 Run Quantum Simulation", use_container_width=True):
+        st.session_state['last_run'] = (protocol, n_qubits, random_seed)
+
+    # Keep showing the last run's results until the button is pressed again
+    if 'last_run' in st.session_state:
         start_time = time.time()
 
-        with st.spinner('Performing Quantum Simulation...'):
-            if protocol == "BB84 Protocol":
-                result = FastQuantumKeyDistribution.bb84_protocol(n_qubits, _seed=random_seed)
-                
-                # Results columns
-                col1, col2, col3, col4 = st.columns(4)
-                
-                with col1:
-                    st.metric("Total Qubits", n_qubits)
-                with col2:
-                    st.metric("Matched Bases", f"{sum(result['matched_bases'])} / {n_qubits}")
-                with col3:
-                    st.metric("Shared Key Length", len(result['shared_key']))
-                with col4:
-                    st.metric(
-                        "Quantum Channel",
-                        "Compromised" if result['eavesdropping_detected'] else "Secure"
-                    )
-            else:
-                result = FastQuantumKeyDistribution.e91_protocol(n_qubits, _seed=random_seed)
-                
-                col1, col2, col3 = st.columns(3)
-                
-                with col1:
-                    st.metric("Total Qubits", n_qubits)
-                with col2:
-                    st.metric("Correlation Rate", f"{result['correlation_rate']:.2%}")
-                with col3:
-                    st.metric(
-                        "Quantum Channel",
-                        "Compromised" if result['eavesdropped'] else "Secure"
-                    )
-
-            # Detailed data display
-            st.header("Detailed Quantum Key Distribution Data")
-            
-            # Create tabs for different data views
-            tab1, tab2, tab3 = st.tabs(["Bits & Bases", "Matched Bases", "Shared Key"])
-            
-            with tab1:
-                if protocol == "BB84 Protocol":
-                    st.subheader("Alice's Bits and Bases")
-                    alice_data = {
-                        'Bits': result['alice_bits'],
-                        'Bases': result['alice_bases'],
-                        'Polarizations Sent': result['alice_polarizations']
-                    }
-                    st.dataframe(alice_data)
-                    
-                    st.subheader("Bob's Bits and Bases")
-                    bob_data = {
-                        'Bits': result['bob_bits'],
-                        'Bases': result['bob_bases'],
-                        'Polarizations Measured': result['bob_polarizations']
-                    }
-                    st.dataframe(bob_data)
-                else:
-                    st.write("Detailed data is not available for the E91 protocol.")
-            
-            with tab2:
-                if protocol == "BB84 Protocol":
-                    st.subheader("Matched Bases Comparison")
-                    matched_data = [
-                        {
-                            'Index': i, 
-                            'Alice Basis': result['alice_bases'][i], 
-                            'Bob Basis': result['bob_bases'][i], 
-                            'Bases Matched': result['matched_bases'][i]
-                        } for i in range(n_qubits)
-                    ]
-                    st.dataframe(matched_data, use_container_width=True)
-                else:
-                    st.write("Detailed data is not available for the E91 protocol.")
-            
-            with tab3:
-                if protocol == "BB84 Protocol":
-                    st.subheader("Shared Quantum Key")
-                    st.write("Bits where Alice and Bob used the same basis:")
-                    st.dataframe(result['shared_key'])
-                else:
-                    st.write("Detailed data is not available for the E91 protocol.")
-
-            # Performance tracking
-            end_time = time.time()
-            st.sidebar.metric("Execution Time", f"{end_time - start_time:.2f} seconds")
+        run_simulation(*st.session_state['last_run'])
+
+        # Performance tracking
+        end_time = time.time()
+        st.sidebar.metric("Execution Time", f"{end_time - start_time:.2f} seconds")
 
     # Information section
     st.sidebar.markdown("---")